@@ -1,13 +1,185 @@
 import sys
+import ast
+import atexit
+import builtins
+import functools
+import hashlib
 from typing import Callable, Any, Dict, Optional
 import inspect
 import random
 import json
 import os
 from datetime import datetime
+from types import MappingProxyType, SimpleNamespace
+
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+except ImportError:  # Fall back to the standard library
+    _loads = json.loads
+
+    def _dumps(obj: Any) -> bytes:
+        return json.dumps(obj, indent=4).encode()
+
+
+# Largest die size; keeps `sides + 1` inside int64 for the numba path
+_MAX_SIDES = 2**62
+
+_roll_impl: Optional[Callable[[int, int], Any]] = None
+np = None  # numpy, imported by _load_roll on the first roll when numba is present
+
+
+def _load_roll() -> Callable[[int, int], Any]:
+    """Build the dice-rolling loop, JIT-compiled when numba is installed."""
+    global np
+    try:
+        import numpy as np
+        from numba import njit
+    except ImportError:  # Fall back to the pure-Python loop
+
+        def _py_roll(num: int, sides: int) -> Any:
+            return [random.randint(1, sides) for _ in range(num)]
+
+        return _py_roll
+
+    @njit(cache=True)
+    def _jit_roll(num: int, sides: int) -> Any:
+        rolls = np.empty(num, dtype=np.int64)
+        for i in range(num):
+            rolls[i] = np.random.randint(1, sides + 1)
+        return rolls
+
+    return _jit_roll
+
+
+def _roll(num: int, sides: int) -> Any:
+    """Roll `num` dice with `sides` sides, importing numba on first use only."""
+    global _roll_impl
+    if _roll_impl is None:
+        _roll_impl = _load_roll()
+    return _roll_impl(num, sides)
+
+
+# Functions built from custom command source, keyed by a digest of the source
+_func_cache: Dict[bytes, Callable] = {}
+
+
+@functools.lru_cache(maxsize=None)
+def _caller_factory(param_count: int) -> Callable[[Callable], Callable]:
+    """Build a factory for callers that pass an args tuple as exactly
+    `param_count` positional arguments, avoiding `*args` unpacking."""
+    params = ", ".join(f"args[{i}]" for i in range(param_count))
+    source = (
+        f"def make(fn):\n"
+        f"    def _call_{param_count}(args):\n"
+        f"        return fn({params})\n"
+        f"    return _call_{param_count}\n"
+    )
+    namespace = {}
+    exec(compile(source, f"<caller:{param_count}>", "exec"), namespace)
+    return namespace["make"]
+
+
+# Attributes that reach interpreter internals without a leading underscore:
+# str.format does its own attribute lookups ('{0.__class__}'), and frame and
+# traceback attributes lead back to the handler module's globals.
+_BLOCKED_ATTRIBUTES = frozenset(
+    "format format_map gi_frame gi_code cr_frame cr_code ag_frame ag_code "
+    "f_back f_builtins f_code f_globals f_locals tb_frame tb_next".split()
+)
+
+
+def _validate_source(tree: ast.AST) -> None:
+    """Reject custom command code that imports modules or reaches internals.
+
+    This is a best-effort sandbox: it blocks imports, every private or dunder
+    name and attribute, and the attributes in _BLOCKED_ATTRIBUTES. It is not
+    a security boundary against hostile code.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            raise ValueError("imports are not allowed")
+        if isinstance(node, ast.Attribute) and (
+            node.attr.startswith("_") or node.attr in _BLOCKED_ATTRIBUTES
+        ):
+            raise ValueError(f"access to '{node.attr}' is not allowed")
+        if isinstance(node, ast.Name) and node.id.startswith("_"):
+            raise ValueError(f"access to '{node.id}' is not allowed")
+
+
+# Builtins available to custom commands, alongside the _validate_source checks
+_SAFE_BUILTINS = (
+    "abs all any bool dict divmod enumerate Exception float int isinstance len "
+    "list max min pow print range reversed round set sorted str sum tuple "
+    "ValueError zip"
+).split()
+
+
+_CO_VARARGS = inspect.CO_VARARGS | inspect.CO_VARKEYWORDS
+
+
+def _signature(function: Callable) -> tuple[int, str]:
+    """Return the parameter count and rendered signature of a command.
+
+    Plain positional functions are read straight from their code object;
+    anything else (varargs, keyword-only, builtins, callables without
+    `__code__`) falls back to `inspect.signature`.
+    """
+    code = getattr(function, "__code__", None)
+    if (
+        code is None
+        or code.co_flags & _CO_VARARGS
+        or code.co_kwonlyargcount
+        or code.co_posonlyargcount
+    ):
+        sig = inspect.signature(function)
+        return len(sig.parameters), str(sig)
+    skip = 1 if inspect.ismethod(function) else 0
+    names = code.co_varnames[skip : code.co_argcount]
+    defaults = function.__defaults__ or ()
+    first_default = len(names) - len(defaults)
+    annotations = getattr(function, "__annotations__", {})
+    params = []
+    for i, name in enumerate(names):
+        param = name
+        if name in annotations:
+            param += f": {inspect.formatannotation(annotations[name])}"
+        if i >= first_default:
+            default = repr(defaults[i - first_default])
+            param += f" = {default}" if name in annotations else f"={default}"
+        params.append(param)
+    sig_str = f"({', '.join(params)})"
+    if "return" in annotations:
+        sig_str += f" -> {inspect.formatannotation(annotations['return'])}"
+    return len(names), sig_str
 
 
 class CommandHandler:
+    # Namespace custom command source is executed in. Builtins are limited to
+    # _SAFE_BUILTINS and `random` to a few functions; _validate_source blocks
+    # imports and private attributes.
+    _SAFE_GLOBALS = MappingProxyType(
+        {
+            "__builtins__": {name: getattr(builtins, name) for name in _SAFE_BUILTINS},
+            "print": print,
+            "random": SimpleNamespace(
+                choice=random.choice,
+                randint=random.randint,
+                random=random.random,
+                sample=random.sample,
+                shuffle=random.shuffle,
+                uniform=random.uniform,
+            ),
+            "int": int,
+            "str": str,
+        }
+    )
+
     def __init__(self, prefix: str = "!", library_file: str = "command_library.json"):
         """Initialize the CommandHandler with a prefix and persistent library.
 
@@ -18,25 +190,29 @@ class CommandHandler:
         self.prefix = prefix
         self.library_file = library_file
         self.commands: Dict[str, Dict[str, Any]] = {}
+        self.aliases: Dict[str, str] = {}  # alias -> canonical command name
+        self._dirty = False  # Unsaved custom command changes
         self.load_library()  # Load saved commands on startup
+        self._dirty = False
 
     def load_library(self) -> None:
         """Load commands from the library file."""
         if os.path.exists(self.library_file):
             try:
-                with open(self.library_file, "r") as f:
-                    library = json.load(f)
+                with open(self.library_file, "rb") as f:
+                    library = _loads(f.read())
                 for cmd, details in library.items():
                     if "custom" in details and details["custom"]:
                         # Rebuild custom commands
                         func = self._create_function(details["source"])
-                        self.commands[cmd] = {
-                            "function": func,
-                            "description": details["description"],
-                            "signature": inspect.signature(func),
-                            "custom": True,
-                            "source": details["source"],
-                        }
+                        # The library file is an input boundary too (hand edits)
+                        self.add_command(
+                            cmd.lower(),
+                            func,
+                            details["description"],
+                            custom=True,
+                            source=details["source"],
+                        )
                     else:
                         # Skip built-in commands (they'll be re-added)
                         continue
@@ -45,7 +221,13 @@ class CommandHandler:
                 print(f"Error loading library: {e}")
 
     def save_library(self) -> None:
-        """Save custom commands to the library file."""
+        """Save custom commands to the library file if they have changed.
+
+        The library is written and fsynced to a temporary file, then moved into
+        place, so an interrupted save never leaves a truncated library behind.
+        """
+        if not self._dirty:
+            return
         library = {}
         for cmd, details in self.commands.items():
             if details.get("custom", False):
@@ -54,12 +236,21 @@ class CommandHandler:
                     "source": details["source"],
                     "custom": True,
                 }
+        tmp_file = self.library_file + ".tmp"
         try:
-            with open(self.library_file, "w") as f:
-                json.dump(library, f, indent=4)
+            with open(tmp_file, "wb") as f:
+                f.write(_dumps(library))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_file, self.library_file)
+            self._dirty = False
             print("Command library saved.")
         except Exception as e:
             print(f"Error saving library: {e}")
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
 
     def add_command(
         self,
@@ -69,91 +260,131 @@ class CommandHandler:
         aliases: list[str] = None,
         custom: bool = False,
         source: str = None,
+        signature: Optional[tuple[int, str]] = None,
     ) -> None:
         """Add a command to the handler.
 
+        Command names and aliases are expected to be lowercase already; input is
+        normalized once at the REPL boundary rather than on every lookup.
+
         Args:
-            command (str): Command name.
+            command (str): Command name (lowercase).
             function (Callable): Function to execute.
             description (str): Command description.
-            aliases (list[str]): Optional aliases.
+            aliases (list[str]): Optional aliases (lowercase).
             custom (bool): Whether this is a user-defined command.
             source (str): Source code if custom.
+            signature (tuple[int, str]): Precomputed `_signature(function)`, if
+                the caller already has it.
         """
         if not callable(function):
             raise ValueError(f"Function for command '{command}' must be callable.")
-        command = command.lower()
+        if __debug__:
+            assert command == command.lower(), f"Command '{command}' must be lowercase."
+        command = sys.intern(command)
+        param_count, sig_str = signature or _signature(function)
+        usage = sig_str.replace("(", "").replace(")", "")
+        custom_tag = "[custom]" if custom else ""
         self.commands[command] = {
             "function": function,
             "description": description,
-            "signature": inspect.signature(function),
+            "sig_str": sig_str,
+            "param_count": param_count,
+            "call": _caller_factory(param_count)(function),
+            "usage": usage,
+            "display": f"  {self.prefix}{command:<15} : {description} {custom_tag} (usage: {command} {usage})",
             "custom": custom,
             "source": source if custom else None,
         }
+        if custom:
+            self._dirty = True
+        self.aliases.pop(command, None)  # A real command shadows an old alias
         if aliases:
             for alias in aliases:
-                self.commands[alias.lower()] = self.commands[command]
+                if __debug__:
+                    assert alias == alias.lower(), f"Alias '{alias}' must be lowercase."
+                if alias in self.commands:
+                    continue  # Never let an alias shadow a real command
+                self.aliases[sys.intern(alias)] = command
+
+    def _resolve(self, command: str) -> str:
+        """Map an alias to its command name; real commands take precedence."""
+        if command in self.commands:
+            return command
+        return self.aliases.get(command, command)
 
     def _create_function(self, source: str) -> Callable:
         """Create a function from user-provided source code."""
+        key = hashlib.blake2b(source.encode(), digest_size=16).digest()
+        if key in _func_cache:
+            return _func_cache[key]
         try:
-            # Basic safety: restrict imports and dangerous builtins
-            safe_globals = {"print": print, "random": random, "int": int, "str": str}
+            # Parse and validate once; the cache skips both on later loads
+            tree = ast.parse(source, mode="exec")
+            _validate_source(tree)
+            func_name = next(
+                node.name for node in tree.body if isinstance(node, ast.FunctionDef)
+            )
+            code = compile(tree, f"<cmd:{func_name}>", "exec")
+            # exec needs a mutable globals dict, so copy the frozen template
             local_vars = {}
-            exec(source, safe_globals, local_vars)
-            func_name = source.split("def ")[1].split("(")[0].strip()
+            exec(code, dict(self._SAFE_GLOBALS), local_vars)
             func = local_vars[func_name]
+            _func_cache[key] = func
             return func
+        except StopIteration:
+            raise ValueError("Invalid function definition: no function defined")
         except Exception as e:
             raise ValueError(f"Invalid function definition: {e}")
 
     def execute(self, command: str, *args: Any) -> Optional[Any]:
-        """Execute a command with arguments."""
-        command = command.lower()
+        """Execute a command with arguments. `command` must be lowercase."""
+        command = self._resolve(command)
         if command in self.commands:
             cmd_info = self.commands[command]
             try:
-                expected_params = len(cmd_info["signature"].parameters)
+                expected_params = cmd_info["param_count"]
                 if len(args) != expected_params:
                     raise TypeError(
                         f"'{command}' expects {expected_params} argument(s), got {len(args)}"
                     )
-                result = cmd_info["function"](*args)
+                result = cmd_info["call"](args)
                 return result
             except TypeError as e:
-                print(f"Error: {e}. Usage: {command} {cmd_info['signature']}")
+                sys.stdout.write(
+                    f"Error: {e}. Usage: {command} {cmd_info['sig_str']}\n"
+                )
             except Exception as e:
-                print(f"Error executing '{command}': {e}")
+                sys.stdout.write(f"Error executing '{command}': {e}\n")
         else:
-            print(f"Command '{command}' not found. Type '{self.prefix}help'.")
+            sys.stdout.write(
+                f"Command '{command}' not found. Type '{self.prefix}help'.\n"
+            )
         return None
 
     def list_commands(self) -> None:
         """List all available commands."""
         if not self.commands:
-            print("No commands available.")
+            sys.stdout.write("No commands available.\n")
         else:
-            print("Available commands:")
-            seen = set()
+            lines = ["Available commands:"]
+            aliases_by_command: Dict[str, list[str]] = {}
+            for alias, cmd in sorted(self.aliases.items()):
+                aliases_by_command.setdefault(cmd, []).append(alias)
             for cmd, details in sorted(self.commands.items()):
-                if cmd not in seen:
-                    seen.add(cmd)
-                    signature = (
-                        str(details["signature"]).replace("(", "").replace(")", "")
-                    )
-                    custom_tag = "[custom]" if details.get("custom") else ""
-                    print(
-                        f"  {self.prefix}{cmd:<15} : {details['description']} {custom_tag} (usage: {cmd} {signature})"
-                    )
+                line = details["display"]
+                if cmd in aliases_by_command:
+                    line += f" [aliases: {', '.join(aliases_by_command[cmd])}]"
+                lines.append(line)
+            sys.stdout.write("\n".join(lines) + "\n")
 
     def get_command_help(self, command: str) -> None:
-        """Provide detailed help for a command."""
-        command = command.lower()
+        """Provide detailed help for a command. `command` must be lowercase."""
+        command = self._resolve(command)
         if command in self.commands:
             cmd_info = self.commands[command]
-            signature = str(cmd_info["signature"]).replace("(", "").replace(")", "")
             print(f"'{self.prefix}{command}': {cmd_info['description']}")
-            print(f"Usage: {self.prefix}{command} {signature}")
+            print(f"Usage: {self.prefix}{command} {cmd_info['usage']}")
             if cmd_info.get("custom"):
                 print(f"Source:\n{cmd_info['source']}")
         else:
@@ -198,7 +429,9 @@ def roll_dice(dice: str = "1d6") -> str:
             raise ValueError("Number of dice and sides must be positive.")
         if num > 100:
             raise ValueError("Cannot roll more than 100 dice at once.")
-        rolls = [random.randint(1, sides) for _ in range(num)]
+        if sides > _MAX_SIDES:
+            raise ValueError(f"Dice cannot have more than {_MAX_SIDES} sides.")
+        rolls = [int(roll) for roll in _roll(num, sides)]
         total = sum(rolls)
         return f"Rolled {dice}: {rolls} = {total}"
     except ValueError as e:
@@ -207,17 +440,18 @@ def roll_dice(dice: str = "1d6") -> str:
 
 def add_command_handler(handler: CommandHandler, name: str, source: str) -> str:
     """Dynamically add a command from user input."""
+    name = name.lower()
     try:
         func = handler._create_function(source)
-        signature = inspect.signature(func)
-        param_count = len(signature.parameters)
-        if param_count > 5:
+        signature = _signature(func)  # Passed on so add_command doesn't redo it
+        if signature[0] > 5:
             return "Error: Custom commands can have up to 5 parameters."
         description = (
             f"Custom command defined on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
         )
-        handler.add_command(name, func, description, custom=True, source=source)
-        handler.save_library()
+        handler.add_command(
+            name, func, description, custom=True, source=source, signature=signature
+        )
         return f"Command '{handler.prefix}{name}' added successfully!"
     except Exception as e:
         return f"Error adding command: {e}"
@@ -225,6 +459,7 @@ def add_command_handler(handler: CommandHandler, name: str, source: str) -> str:
 
 def main():
     handler = CommandHandler(prefix="!")
+    atexit.register(handler.save_library)  # Flush unsaved commands on any exit
 
     # Add built-in commands
     handler.add_command("greet", greet, "Greets the user by name.", aliases=["hello"])
@@ -244,46 +479,76 @@ def main():
     )
     print("Add custom commands with '!addcmd <name> <source>' (use \\n for newlines).")
 
+    write = sys.stdout.write
+    flush = sys.stdout.flush
+    readline = sys.stdin.readline
+
+    def _do_exit(rest: str) -> bool:
+        if rest:
+            return False  # Not a bare 'exit'; treat it as a regular command
+        handler.save_library()
+        print("Goodbye!")
+        sys.exit(0)
+
+    def _do_help(rest: str) -> bool:
+        if rest:
+            handler.get_command_help(rest.lower())
+        else:
+            handler.list_commands()
+        return True
+
+    # REPL meta-commands, dispatched before regular command lookup. A handler
+    # returns False to fall through to handler.execute.
+    meta = {"exit": _do_exit, "help": _do_help}
+
     while True:
         try:
-            user_input = input("> ").strip()
+            write("> ")
+            flush()
+            line = readline()
+            if not line:  # EOF on piped or scripted input
+                handler.save_library()
+                write("\n")
+                sys.exit(0)
+            user_input = line.strip()
             if not user_input:
                 continue
 
             if not user_input.startswith(handler.prefix):
-                print(
-                    f"Commands must start with '{handler.prefix}'. Type '{handler.prefix}help'."
+                write(
+                    f"Commands must start with '{handler.prefix}'. Type '{handler.prefix}help'.\n"
                 )
                 continue
 
             user_input = user_input[len(handler.prefix) :]
-            if user_input == "exit":
-                handler.save_library()
-                print("Goodbye!")
-                sys.exit(0)
-
-            if user_input == "help":
-                handler.list_commands()
-                continue
-
-            if user_input.startswith("help "):
-                command = user_input.split(" ", 1)[1].strip()
-                handler.get_command_help(command)
+            parts = user_input.split(None, 1)
+            # Interned so dict lookups hit the identity fast path
+            command = sys.intern(parts[0].lower())
+            rest = parts[1] if len(parts) > 1 else ""
+            meta_fn = meta.get(command)
+            if meta_fn is not None and meta_fn(rest):
                 continue
 
-            parts = user_input.split(maxsplit=2)
-            command = parts[0]
-            args = parts[1:] if len(parts) > 1 else []
+            if not rest:
+                args = []
+            else:
+                # Split no further than the command's arity so the last
+                # argument keeps its spaces
+                cmd_info = handler.commands.get(handler._resolve(command))
+                if cmd_info is None or cmd_info["param_count"] < 2:
+                    args = [rest]
+                else:
+                    args = rest.split(maxsplit=cmd_info["param_count"] - 1)
             result = handler.execute(command, *args)
             if result is not None:
-                print(f"Result: {result}")
+                write(f"Result: {result}\n")
 
         except KeyboardInterrupt:
             handler.save_library()
             print("\nInterrupted. Exiting gracefully...")
             sys.exit(0)
         except Exception as e:
-            print(f"Unexpected error: {e}")
+            write(f"Unexpected error: {e}\n")
 
 
 if __name__ == "__main__":